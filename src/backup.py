@@ -1,16 +1,27 @@
 import os
+import atexit
+import collections
 import datetime
-import glob
-import requests
+import hashlib
+import io
 import threading
+import queue
+import re
+import select
+import socket
 import concurrent.futures
-import paramiko
 import time
-from git import Repo, InvalidGitRepositoryError
-from dotenv import load_dotenv
+
+# paramiko, git e requests são pesados (criptografia, cffi) e ficam em
+# imports tardios dentro das funções que os usam: uma execução que aborta
+# cedo (sem hosts/credenciais) não paga o custo de carregá-los
 
 # Load environment variables
-load_dotenv()
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
 
 # Configuration
 ROUTER_HOSTS = os.getenv("ROUTER_HOSTS", "").split(",")
@@ -20,172 +31,500 @@ PASSWORD = os.getenv("DATACOM_PASSWORD")
 BACKUP_DIR = os.getenv("BACKUP_DIR", "/backups")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "10"))
+
+# Queue feeding the single background Git writer thread, so SSH workers
+# never block on disk-bound Git/cleanup work
+GIT_QUEUE = queue.Queue()
+_GIT_QUEUE_SENTINEL = object()
+
+# Shared HTTP session so Telegram calls reuse one TLS connection and retry
+# transient API errors instead of failing the notification outright
+_HTTP = None
+
+def _get_http_session():
+    """Returns the shared HTTP session, creating it on first use."""
+    global _HTTP
+    if _HTTP is None:
+        import requests
+        from requests.adapters import HTTPAdapter, Retry
+
+        _HTTP = requests.Session()
+        _HTTP.mount("https://", HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=4,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+        ))
+    return _HTTP
+
+# Pool of authenticated SSH transports, reused between backups so we only pay
+# the TCP + key exchange + auth cost once per (host, user) instead of per run.
+_TRANSPORT_POOL = {}
+_TRANSPORT_LOCKS = {}
+_TRANSPORT_LOCKS_GUARD = threading.Lock()
+
+# Limita handshakes SSH não autenticados em voo: sshd descarta conexões
+# acima de MaxStartups (default 10), então ficamos com folga abaixo disso
+# mesmo com MAX_WORKERS alto. Transports já cacheados não passam por aqui.
+_SSH_CONNECT_SEM = threading.Semaphore(8)
+
+def _transport_lock(key):
+    """Returns the per-key lock for a pool entry, creating it if needed."""
+    with _TRANSPORT_LOCKS_GUARD:
+        if key not in _TRANSPORT_LOCKS:
+            _TRANSPORT_LOCKS[key] = threading.Lock()
+        return _TRANSPORT_LOCKS[key]
 
-# Lock for Git operations to prevent race conditions
-GIT_LOCK = threading.Lock()
+# Cifras AEAD primeiro: AES-GCM usa AES-NI e dispensa o HMAC por byte,
+# cortando o custo de CPU da transferência da config
+_PREFERRED_CIPHERS = ('aes128-gcm@openssh.com', 'aes256-gcm@openssh.com', 'chacha20-poly1305@openssh.com')
+_PREFERRED_MACS = ('hmac-sha2-256-etm@openssh.com',)
+
+def _tune_transport_security(transport):
+    """Reorders the transport's algorithms to favor hardware-accelerated crypto."""
+    opts = transport.get_security_options()
+    opts.ciphers = tuple(c for c in _PREFERRED_CIPHERS if c in opts.ciphers) + \
+        tuple(c for c in opts.ciphers if c not in _PREFERRED_CIPHERS)
+    opts.digests = tuple(m for m in _PREFERRED_MACS if m in opts.digests) + \
+        tuple(m for m in opts.digests if m not in _PREFERRED_MACS)
+    # Sem kex SHA-1 legado; sobra curve25519/ECDH, bem mais rápidos
+    no_sha1 = tuple(k for k in opts.kex if not k.endswith('-sha1'))
+    if no_sha1:
+        opts.kex = no_sha1
+
+def _get_or_open_transport(hostname, username, password, port):
+    """Returns a cached authenticated Transport for the host, reconnecting if dead."""
+    import paramiko
+
+    key = (hostname, username)
+    with _transport_lock(key):
+        transport = _TRANSPORT_POOL.get(key)
+        if transport is not None and transport.is_active():
+            return transport
+
+        # Transport morto ou inexistente: abrir e autenticar um novo.
+        # Socket próprio com timeout: o construtor do Transport com tupla
+        # conecta sem timeout e um host inalcançável travaria o lock e uma
+        # vaga do semáforo pelo timeout default do SO (~2 min)
+        with _SSH_CONNECT_SEM:
+            sock = socket.create_connection((hostname, port), timeout=30)
+            transport = paramiko.Transport(sock)
+            transport.banner_timeout = 30
+            _tune_transport_security(transport)
+            try:
+                transport.connect(username=username, password=password)
+            except Exception:
+                # Não deixar socket + thread leitora vazando a cada falha
+                transport.close()
+                raise
+        transport.set_keepalive(30)
+        _TRANSPORT_POOL[key] = transport
+        return transport
+
+def _close_transports():
+    """Closes all pooled transports on process exit."""
+    for transport in _TRANSPORT_POOL.values():
+        try:
+            transport.close()
+        except Exception:
+            pass
+
+atexit.register(_close_transports)
+
+# Pool de workers compartilhado entre execuções de main() (relevante em
+# deploys daemon), criado sob demanda e encerrado só na saída do processo
+_EXECUTOR = None
+
+def _get_executor(max_workers):
+    """Returns the shared worker pool, recreating it if more workers are needed."""
+    global _EXECUTOR
+    if _EXECUTOR is None or _EXECUTOR._max_workers < max_workers:
+        if _EXECUTOR is not None:
+            _EXECUTOR.shutdown(wait=False)
+        _EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="backup")
+    return _EXECUTOR
+
+def _shutdown_executor():
+    """Shuts down the shared worker pool on process exit."""
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=False)
+
+atexit.register(_shutdown_executor)
 
 def get_timestamp():
-    return datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    # time.strftime evita construir um objeto datetime por chamada
+    return time.strftime("%Y%m%d_%H%M%S")
+
+# Telegram rejeita mensagens acima de 4096 chars com 400; quebramos com
+# folga para a formatação Markdown
+_TELEGRAM_MSG_LIMIT = 3500
+
+# Blocos por host do relatório: template constante + format_map, um único
+# join em vez de meia dúzia de appends formatados por host
+_SUCCESS_TMPL = (
+    "🖥 *{hostname}*\n"
+    "  • Arquivo: `{filename}`\n"
+    "  • Tamanho: `{size_kb:.2f} KB`\n"
+    "  • Tempo: `{duration:.2f}s`\n"
+    "\n"
+)
+_UNCHANGED_TMPL = (
+    "🖥 *{hostname}*\n"
+    "  • Sem alterações desde o último backup\n"
+    "  • Tempo: `{duration:.2f}s`\n"
+    "\n"
+)
+_FAILED_TMPL = (
+    "🖥 IP: `{ip}`\n"
+    "  • Erro: `{error}`\n"
+    "\n"
+)
+
+def _split_message(message):
+    """Splits a message into chunks under the Telegram size limit, at line boundaries."""
+    if len(message) <= _TELEGRAM_MSG_LIMIT:
+        return [message]
+
+    chunks = []
+    lines = []
+    size = 0
+    for line in message.split("\n"):
+        # Linha individual acima do limite (ex.: texto de exceção longo):
+        # cortar na marra, senão o chunk estoura e o Telegram responde 400
+        while len(line) > _TELEGRAM_MSG_LIMIT:
+            if lines:
+                chunks.append("\n".join(lines))
+                lines = []
+                size = 0
+            chunks.append(line[:_TELEGRAM_MSG_LIMIT])
+            line = line[_TELEGRAM_MSG_LIMIT:]
+        if lines and size + len(line) + 1 > _TELEGRAM_MSG_LIMIT:
+            chunks.append("\n".join(lines))
+            lines = []
+            size = 0
+        lines.append(line)
+        size += len(line) + 1
+    if lines:
+        chunks.append("\n".join(lines))
+    return chunks
 
 def send_telegram_notification(message):
-    """Sends a notification to Telegram."""
+    """Sends a notification to Telegram, splitting it if over the API limit."""
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
         print("Telegram credentials not configured. Skipping notification.")
         return
 
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    payload = {
-        "chat_id": TELEGRAM_CHAT_ID,
-        "text": message,
-        "parse_mode": "Markdown"
-    }
+    http = _get_http_session()
 
-    try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        print("Telegram notification sent.")
-    except Exception as e:
-        print(f"Failed to send Telegram notification: {e}")
+    for chunk in _split_message(message):
+        payload = {
+            "chat_id": TELEGRAM_CHAT_ID,
+            "text": chunk,
+            "parse_mode": "Markdown"
+        }
+
+        try:
+            response = http.post(url, json=payload, timeout=10)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"Failed to send Telegram notification: {e}")
+            return
+
+    print("Telegram notification sent.")
 
 def init_git_repo():
     """Initializes a git repository in the backup directory if it doesn't exist."""
+    from git import Repo, InvalidGitRepositoryError
+
     try:
         repo = Repo(BACKUP_DIR)
     except InvalidGitRepositoryError:
         print("Initializing Git repository...")
         repo = Repo.init(BACKUP_DIR)
+
+    try:
+        # Index v4 comprime os paths: menos bytes reescritos por add
+        repo.git.update_index("--index-version", "4")
+
+        with repo.config_writer() as cw:
+            # BACKUP_DIR costuma ser um volume montado (às vezes NFS):
+            # não reescrever o mtime de packfiles existentes evita
+            # invalidar o cache do cliente a cada commit, e gc automático
+            # fica desligado para o git não repactuar no meio de um job
+            cw.set_value("core", "freshenPackfiles", "false")
+            cw.set_value("gc", "auto", "0")
+
+            # O commit via git CLI exige identidade configurada; garantir
+            # a do container (ver Dockerfile) caso não exista config global
+            if not repo.config_reader().has_option("user", "email"):
+                cw.set_value("user", "name", "Backup Bot")
+                cw.set_value("user", "email", "backup@bot.com")
+    except Exception as e:
+        print(f"Could not configure repository: {e}")
+
     return repo
 
 MAX_BACKUPS = int(os.getenv("MAX_BACKUPS", "10"))
 
-def commit_to_git(repo, filename, hostname):
-    """Commits the change to git."""
+# Tabela de sanitização de hostname para nome de arquivo: um único passe
+# via str.translate em vez de uma cadeia de str.replace
+_HOSTNAME_SANITIZE = str.maketrans({c: "_" for c in '/\\:*?"<>|'} | {";": ""})
+
+# Linha "hostname <nome>" no início da config (linhas de comentário com
+# ! ou # não casam porque o match exige o comando no começo da linha)
+_HOSTNAME_RE = re.compile(rb'(?m)^[ \t]*hostname[ \t]+([^\s#!]+)', re.IGNORECASE)
+
+def commit_backup_batch(repo, success_details):
+    """Commits all backups from a job as a single commit."""
+    if not success_details:
+        return
+
     try:
-        # Path relativo incluindo a pasta do hostname
-        relative_path = os.path.join(hostname, filename)
-        repo.index.add([relative_path])
-        # Always commit since filename is unique
-        repo.index.commit(f"Backup {hostname} - {filename}")
-        print(f"Committed {relative_path} to Git.")
+        relative_paths = [detail["relative_path"] for detail in success_details]
+        # git CLI em vez de repo.index: o add do GitPython relê e
+        # re-serializa o index inteiro em Python puro a cada chamada
+        repo.git.add(relative_paths)
+        # Um commit por job: uma árvore e um objeto de commit em vez de N
+        hostnames = ", ".join(detail["hostname"] for detail in success_details)
+        timestamp = get_timestamp()
+        repo.git.commit("-m", f"Backup job {timestamp}: {len(success_details)} hosts ({hostnames})")
+        print(f"Committed {len(relative_paths)} backups to Git.")
     except Exception as e:
         print(f"Git commit failed: {e}")
 
-def cleanup_old_backups(hostname):
+def _git_writer(repo):
+    """Drains GIT_QUEUE in batches and performs Git/cleanup work off the worker path."""
+    done = False
+    while not done:
+        try:
+            item = GIT_QUEUE.get(timeout=0.5)
+        except queue.Empty:
+            continue
+
+        # Drenar tudo que já está na fila para commitar em lote
+        batch = [item]
+        try:
+            while True:
+                batch.append(GIT_QUEUE.get_nowait())
+        except queue.Empty:
+            pass
+
+        if _GIT_QUEUE_SENTINEL in batch:
+            batch.remove(_GIT_QUEUE_SENTINEL)
+            done = True
+
+        if batch:
+            commit_backup_batch(repo, batch)
+            # Um cleanup por hostname distinto, com todos os paths novos do
+            # lote de uma vez (um lote pode ter vários backups do mesmo
+            # hostname, ex.: IP duplicado ou hostnames de fábrica iguais)
+            batch_paths = {}
+            for detail in batch:
+                batch_paths.setdefault(detail["hostname"], []).append(
+                    os.path.join(BACKUP_DIR, detail["relative_path"]))
+            for hostname, new_paths in batch_paths.items():
+                cleanup_old_backups(hostname, new_paths)
+
+# Histórico em memória dos backups por hostname (mais antigo primeiro).
+# Semeado com um scandir no primeiro toque; depois disso o cleanup não
+# precisa mais reler o diretório. Só o writer Git mexe aqui.
+_HOST_BACKUPS = {}
+
+def cleanup_old_backups(hostname, new_paths):
     """Keeps only the last N backups for a given hostname."""
     try:
-        # Buscar backups na pasta do hostname
-        hostname_dir = os.path.join(BACKUP_DIR, hostname)
-        if not os.path.exists(hostname_dir):
-            return
-        
-        # Find all backups for this hostname dentro da pasta
-        pattern = os.path.join(hostname_dir, f"{hostname}_*.conf")
-        files = glob.glob(pattern)
-        
-        # Sort by modification time (newest last)
-        files.sort(key=os.path.getmtime)
-        
-        if len(files) > MAX_BACKUPS:
-            files_to_delete = files[:-MAX_BACKUPS]
-            for f in files_to_delete:
+        backups = _HOST_BACKUPS.get(hostname)
+        if backups is None:
+            # Primeiro toque: um scandir único semeia o histórico
+            # (já inclui o backup recém-gravado).
+            # scandir devolve o stat cacheado do dirent: um stat por arquivo,
+            # em vez de glob (stat) + sort por getmtime (outro stat)
+            hostname_dir = os.path.join(BACKUP_DIR, hostname)
+            if not os.path.exists(hostname_dir):
+                return
+            prefix = f"{hostname}_"
+            with os.scandir(hostname_dir) as it:
+                entries = [
+                    (entry.stat().st_mtime, entry.path)
+                    for entry in it
+                    if entry.is_file() and entry.name.startswith(prefix) and entry.name.endswith(".conf")
+                ]
+            # Sort by modification time (newest last)
+            entries.sort()
+            backups = collections.deque(path for _, path in entries)
+            _HOST_BACKUPS[hostname] = backups
+        else:
+            for new_path in new_paths:
+                # Só paths que ainda existem: um path já deletado por um
+                # cleanup anterior não pode voltar para o histórico
+                if new_path not in backups and os.path.exists(new_path):
+                    backups.append(new_path)
+
+        while len(backups) > MAX_BACKUPS:
+            f = backups.popleft()
+            try:
                 os.remove(f)
-                print(f"Deleted old backup: {f}")
-                
-                # Optional: Remove from git index if you want to keep git clean, 
-                # but usually we keep history in git and only clean disk.
-                # If we want to remove from git as well:
-                # repo.index.remove([f]) 
+            except FileNotFoundError:
+                continue
+            print(f"Deleted old backup: {f}")
+
+            # Optional: Remove from git index if you want to keep git clean,
+            # but usually we keep history in git and only clean disk.
+            # If we want to remove from git as well:
+            # repo.index.remove([f])
     except Exception as e:
         print(f"Cleanup failed for {hostname}: {e}")
 
-def backup_router(hostname, repo):
+def backup_router(hostname):
+    import paramiko
+
     print(f"Starting backup for {hostname}...")
-    start_time = datetime.datetime.now()
-    
-    # Criar cliente SSH Paramiko
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    
+    # monotonic: imune a ajustes de relógio (NTP) e mais barato que datetime.now
+    start_time = time.monotonic()
+
+    chan = None
+    temp_path = None
+
     try:
-        # Conectar ao dispositivo
+        # Conectar ao dispositivo (transport é reaproveitado do pool)
         print(f"Connecting to {hostname}...")
-        client.connect(
-            hostname=hostname.strip(),
-            username=USERNAME,
-            password=PASSWORD,
-            port=int(PORT),
-            timeout=30,
-            look_for_keys=False,
-            allow_agent=False,
-            banner_timeout=30
-        )
-        
+        transport = _get_or_open_transport(hostname.strip(), USERNAME, PASSWORD, int(PORT))
+
         print(f"Connected to {hostname}")
-        
+
         # Usar exec_command para executar comandos de forma não-interativa
         # Isso evita problemas com paginação e prompts
-        
-        # Obter configuração completa
-        stdin, stdout, stderr = client.exec_command("show running-config", timeout=60)
-        config_output = stdout.read().decode('utf-8', errors='ignore')
-        error_output = stderr.read().decode('utf-8', errors='ignore')
-        
+
+        # Obter configuração completa em um canal novo sobre o transport cacheado
+        chan = transport.open_session()
+        # Backstop: nenhum recv individual pode bloquear mais que 60s
+        chan.settimeout(60)
+        chan.exec_command("show running-config")
+
+        # Stream direto para disco em chunks binários, sem materializar o
+        # config inteiro em memória nem decodificar/re-encodar UTF-8.
+        # Só os primeiros KB ficam em RAM para extrair o hostname.
+        #
+        # Drenagem via select em vez de recv bloqueante: alguns
+        # equipamentos demoram segundos para fechar o stdout depois do
+        # último byte, então saímos assim que o comando termina em vez de
+        # esperar o EOF do dispositivo.
+        temp_path = os.path.join(BACKUP_DIR, f".{hostname.strip()}.part")
+        head = bytearray()
+        sha = hashlib.sha256()
+        bytes_written = 0
+        idle = 0.0
+        error_chunks = []
+        with open(temp_path, "wb") as f:
+            while True:
+                readable, _, _ = select.select([chan], [], [], 2.0)
+                if readable:
+                    # O fd do canal sinaliza stdout E stderr juntos; se o
+                    # stderr não for drenado aqui, o select fica readable
+                    # para sempre e o recv de stdout bloqueia
+                    if chan.recv_stderr_ready():
+                        error_chunks.append(chan.recv_stderr(65536))
+                        idle = 0.0
+                        continue
+                    chunk = chan.recv(65536)
+                    if not chunk:
+                        break
+                    idle = 0.0
+                    f.write(chunk)
+                    sha.update(chunk)
+                    bytes_written += len(chunk)
+                    if len(head) < 65536:
+                        head += chunk
+                else:
+                    # Comando já terminou e não há mais nada para ler
+                    if chan.exit_status_ready() and not chan.recv_ready():
+                        break
+                    idle += 2.0
+                    if idle >= 60:
+                        raise TimeoutError(f"No data from {hostname} for 60s")
+
+        while chan.recv_stderr_ready():
+            error_chunks.append(chan.recv_stderr(65536))
+        error_output = b"".join(error_chunks).decode('utf-8', errors='ignore')
+
         if error_output:
             print(f"Warning: stderr output: {error_output}")
         
-        # Extrair hostname da configuração
-        device_hostname = hostname.strip()  # Default para o IP
-        for line in config_output.split('\n'):
-            if 'hostname' in line.lower() and not line.strip().startswith('!') and not line.strip().startswith('#'):
-                parts = line.split()
-                if len(parts) >= 2 and parts[0].lower() == 'hostname':
-                    device_hostname = parts[1]
-                    break
+        # Extrair hostname do início da configuração: um único search em C
+        # sobre os bytes (limitado aos primeiros 16 KiB), sem split de
+        # linhas nem comparações por linha em Python
+        match = _HOSTNAME_RE.search(head, 0, 16384)
+        if match:
+            device_hostname = match.group(1).decode('ascii', errors='ignore')
+        else:
+            device_hostname = hostname.strip()  # Default para o IP
         
         # Sanitizar hostname para uso em nome de arquivo
-        device_hostname = device_hostname.replace(";", "").replace("/", "_").replace("\\", "_").replace(":", "_").replace("*", "_").replace("?", "_").replace('"', "_").replace("<", "_").replace(">", "_").replace("|", "_")
+        device_hostname = device_hostname.translate(_HOSTNAME_SANITIZE)
         
         print(f"Device hostname: {device_hostname}")
         
         # Criar diretório para o hostname se não existir
         hostname_dir = os.path.join(BACKUP_DIR, device_hostname)
         os.makedirs(hostname_dir, exist_ok=True)
-        
-        # Salvar backup com timestamp dentro da pasta do hostname
+
+        file_size_kb = bytes_written / 1024
+
+        # Comparar com o hash do último backup: config idêntica não gera
+        # novo arquivo nem commit
+        digest = sha.hexdigest()
+        digest_path = os.path.join(hostname_dir, ".last_sha256")
+        last_digest = None
+        try:
+            with open(digest_path) as df:
+                last_digest = df.read().strip()
+        except OSError:
+            pass
+
+        if digest == last_digest:
+            duration = time.monotonic() - start_time
+            print(f"Config unchanged for {device_hostname}; skipping backup.")
+            return True, {
+                "hostname": device_hostname,
+                "ip": hostname.strip(),
+                "unchanged": True,
+                "size_kb": file_size_kb,
+                "duration": duration
+            }
+
+        # Mover o arquivo já gravado para o nome final com timestamp
         timestamp = get_timestamp()
         filename = f"{device_hostname}_{timestamp}.conf"
         filepath = os.path.join(hostname_dir, filename)
-        
-        with open(filepath, "w") as f:
-            f.write(config_output)
-        
-        # Obter tamanho do arquivo
-        file_size = os.path.getsize(filepath)
-        file_size_kb = file_size / 1024
-        
+
+        os.replace(temp_path, filepath)
+        temp_path = None
+
+        with open(digest_path, "w") as df:
+            df.write(digest)
+
         # Calcular duração
-        end_time = datetime.datetime.now()
-        duration = (end_time - start_time).total_seconds()
-        
+        duration = time.monotonic() - start_time
+
         print(f"Backup saved to {filepath}")
-        
-        # Seção crítica: operações Git e cleanup devem ser sequenciais
-        with GIT_LOCK:
-            # Commit no Git
-            commit_to_git(repo, filename, device_hostname)
-            
-            # Cleanup de backups antigos
-            cleanup_old_backups(device_hostname)
-        
-        # Retornar sucesso com detalhes
-        return True, {
+
+        detail = {
             "hostname": device_hostname,
             "ip": hostname.strip(),
             "filename": filename,
+            "relative_path": os.path.join(device_hostname, filename),
             "size_kb": file_size_kb,
             "duration": duration,
             "timestamp": timestamp
         }
+
+        # Entregar para o writer Git em background; o worker não bloqueia em I/O de disco
+        GIT_QUEUE.put(detail)
+
+        # Retornar sucesso com detalhes
+        return True, detail
         
     except paramiko.AuthenticationException as e:
         error_msg = f"Authentication failed for {hostname}: {e}"
@@ -200,10 +539,18 @@ def backup_router(hostname, repo):
         print(error_msg)
         return False, error_msg
     finally:
+        # Fechar apenas o canal; o transport fica vivo no pool para o próximo run
         try:
-            client.close()
+            if chan is not None:
+                chan.close()
         except:
             pass
+        # Remover arquivo parcial se o backup não chegou a ser renomeado
+        try:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+        except OSError:
+            pass
 
 def main():
     if not ROUTER_HOSTS or ROUTER_HOSTS == ['']:
@@ -220,77 +567,82 @@ def main():
     # Initialize Git
     repo = init_git_repo()
 
+    # Writer único para as operações Git, alimentado pelos workers via fila
+    git_writer = threading.Thread(target=_git_writer, args=(repo,), daemon=True)
+    git_writer.start()
+
     print(f"Starting backup job for {len(ROUTER_HOSTS)} routers.")
-    job_start_time = datetime.datetime.now()
+    job_start = time.monotonic()
     
     success_details = []
     failed_hosts = []
 
     # Use ThreadPoolExecutor for parallel backups
-    # Default to 5 workers or the number of hosts, whichever is smaller
-    max_workers = min(len(ROUTER_HOSTS), 10)
+    # Worker count is capped by MAX_WORKERS so large fleets can raise the
+    # fan-out; pooled transports keep the per-worker connection cost low.
+    max_workers = min(len(ROUTER_HOSTS), MAX_WORKERS)
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Create a dictionary to map futures to hosts
-        future_to_host = {executor.submit(backup_router, host, repo): host for host in ROUTER_HOSTS if host}
-        
-        for future in concurrent.futures.as_completed(future_to_host):
-            host = future_to_host[future]
-            try:
-                success, result = future.result()
-                if success:
-                    success_details.append(result)
-                else:
-                    failed_hosts.append({"ip": host.strip(), "error": result})
-            except Exception as exc:
-                failed_hosts.append({"ip": host.strip(), "error": f"Thread exception: {exc}"})
+    executor = _get_executor(max_workers)
+
+    # Create a dictionary to map futures to hosts
+    future_to_host = {executor.submit(backup_router, host): host for host in ROUTER_HOSTS if host}
 
+    for future in concurrent.futures.as_completed(future_to_host):
+        host = future_to_host[future]
+        try:
+            success, result = future.result()
+            if success:
+                success_details.append(result)
+            else:
+                failed_hosts.append({"ip": host.strip(), "error": result})
+        except Exception as exc:
+            failed_hosts.append({"ip": host.strip(), "error": f"Thread exception: {exc}"})
+
+    # Sinalizar o fim do job e aguardar o writer terminar os commits pendentes
+    GIT_QUEUE.put(_GIT_QUEUE_SENTINEL)
+    git_writer.join()
+
+    total_duration = time.monotonic() - job_start
+    # datetime só para o horário legível do relatório
     job_end_time = datetime.datetime.now()
-    total_duration = (job_end_time - job_start_time).total_seconds()
 
     # Send Telegram Notification
     if failed_hosts or success_details:
-        # Build enhanced message
-        message_lines = []
-        
+        # Build enhanced message (buffer único, sem lista intermediária)
+        buf = io.StringIO()
+
         if failed_hosts:
-            message_lines.append("🔴 *BACKUP JOB - FALHA PARCIAL*")
+            buf.write("🔴 *BACKUP JOB - FALHA PARCIAL*\n")
         else:
-            message_lines.append("✅ *BACKUP JOB - SUCESSO*")
-        
-        message_lines.append("━━━━━━━━━━━━━━━━━━━━")
-        
+            buf.write("✅ *BACKUP JOB - SUCESSO*\n")
+
+        buf.write("━━━━━━━━━━━━━━━━━━━━\n")
+
         # Job summary
-        message_lines.append(f"📊 *Resumo da Execução*")
-        message_lines.append(f"• Total de dispositivos: `{len(ROUTER_HOSTS)}`")
-        message_lines.append(f"• Sucesso: `{len(success_details)}`")
-        message_lines.append(f"• Falhas: `{len(failed_hosts)}`")
-        message_lines.append(f"• Duração total: `{total_duration:.2f}s`")
-        message_lines.append(f"• Horário: `{job_end_time.strftime('%d/%m/%Y %H:%M:%S')}`")
-        message_lines.append("")
-        
+        buf.write("📊 *Resumo da Execução*\n")
+        buf.write(f"• Total de dispositivos: `{len(ROUTER_HOSTS)}`\n")
+        buf.write(f"• Sucesso: `{len(success_details)}`\n")
+        buf.write(f"• Falhas: `{len(failed_hosts)}`\n")
+        buf.write(f"• Duração total: `{total_duration:.2f}s`\n")
+        buf.write(f"• Horário: `{job_end_time.strftime('%d/%m/%Y %H:%M:%S')}`\n")
+        buf.write("\n")
+
         # Success details
         if success_details:
-            message_lines.append("✅ *Backups Realizados*")
-            message_lines.append("━━━━━━━━━━━━━━━━━━━━")
-            for detail in success_details:
-                message_lines.append(f"🖥 *{detail['hostname']}*")
-                message_lines.append(f"  • Arquivo: `{detail['filename']}`")
-                message_lines.append(f"  • Tamanho: `{detail['size_kb']:.2f} KB`")
-                message_lines.append(f"  • Tempo: `{detail['duration']:.2f}s`")
-                message_lines.append("")
-        
+            buf.write("✅ *Backups Realizados*\n")
+            buf.write("━━━━━━━━━━━━━━━━━━━━\n")
+            buf.write("".join(
+                (_UNCHANGED_TMPL if detail.get("unchanged") else _SUCCESS_TMPL).format_map(detail)
+                for detail in success_details
+            ))
+
         # Failed details
         if failed_hosts:
-            message_lines.append("❌ *Falhas*")
-            message_lines.append("━━━━━━━━━━━━━━━━━━━━")
-            for failed in failed_hosts:
-                message_lines.append(f"🖥 IP: `{failed['ip']}`")
-                message_lines.append(f"  • Erro: `{failed['error']}`")
-                message_lines.append("")
-        
-        message = "\n".join(message_lines)
-        send_telegram_notification(message)
+            buf.write("❌ *Falhas*\n")
+            buf.write("━━━━━━━━━━━━━━━━━━━━\n")
+            buf.write("".join(_FAILED_TMPL.format_map(failed) for failed in failed_hosts))
+
+        send_telegram_notification(buf.getvalue())
 
     print("Backup job completed.")
 